@@ -0,0 +1,263 @@
+"""Deadline-aware admission control for /predict"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Inference priority lanes (lower priority value is scheduled first).
+# on_miss decides what happens to a queued request that can no longer meet
+# its deadline: 'shed' rejects it, 'downgrade' moves it to the named lane.
+PRIORITY_LANES = {
+    'first_report': {'priority': 0, 'deadline_ms': 5000, 'on_miss': 'shed'},
+    'verification': {'priority': 1, 'deadline_ms': 15000, 'on_miss': 'downgrade', 'downgrade_to': 'background'},
+    'background': {'priority': 2, 'deadline_ms': 120000, 'on_miss': 'shed'}
+}
+
+class RequestShed(Exception):
+    """Raised when a request cannot be admitted within its deadline"""
+
+    def __init__(self, lane, reason):
+        super().__init__(reason)
+        self.lane = lane
+        self.reason = reason
+
+class AdmissionTicket:
+    """A queued /predict request"""
+
+    def __init__(self, lane, deadline, caller_deadline=None):
+        self.lane = lane
+        self.deadline = deadline
+        # Absolute deadline requested by the caller, kept across downgrades
+        self.caller_deadline = caller_deadline
+        self.enqueued_at = time.monotonic()
+        self.lane_enqueued_at = self.enqueued_at
+        self.started_at = None
+        self.downgraded = False
+        self.state = 'new'
+        self.entry = None
+
+class AdmissionController:
+    """Deadline-aware priority scheduler in front of model inference
+
+    At most `concurrency` requests run inference at once. Waiting requests
+    are served by lane priority, then earliest deadline. A request that
+    cannot finish before its deadline (given the observed service time) is
+    shed or downgraded according to its lane instead of running.
+    """
+
+    def __init__(self, lanes, concurrency, default_lane, api_keys=None, service_time=0.5):
+        api_keys = api_keys or {}
+        if default_lane not in lanes:
+            raise ValueError(f"Unknown default lane '{default_lane}', expected one of {list(lanes)}")
+        unknown = sorted(set(api_keys.values()) - set(lanes))
+        if unknown:
+            raise ValueError(f"API keys map to unknown lanes {unknown}, expected one of {list(lanes)}")
+
+        self.lanes = lanes
+        self.concurrency = max(1, concurrency)
+        self.default_lane = default_lane
+        self.api_keys = api_keys
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._running = 0
+        # EWMA of inference service time in seconds
+        self._service_time = service_time
+        self.stats = {name: self._empty_stats() for name in lanes}
+
+    @staticmethod
+    def _empty_stats():
+        return {
+            'received': 0,
+            'completed': 0,
+            'failed': 0,
+            'shed': 0,
+            'downgraded_in': 0,
+            'downgraded_out': 0,
+            'slo_met': 0,
+            'slo_missed': 0,
+            'queue_samples': 0,
+            'queue_time_ms_total': 0.0,
+            'queue_time_ms_max': 0.0
+        }
+
+    def classify(self, headers):
+        """Pick a lane from the API key, falling back to the lane header"""
+        api_key = headers.get('X-API-Key')
+        if api_key and api_key in self.api_keys:
+            return self.api_keys[api_key]
+        lane = headers.get('X-Priority-Lane', self.default_lane)
+        return lane if lane in self.lanes else self.default_lane
+
+    def acquire(self, lane, deadline_ms=None):
+        """Block until the request may run inference, or raise RequestShed"""
+        now = time.monotonic()
+        caller_deadline = now + deadline_ms / 1000.0 if deadline_ms is not None else None
+        ticket = AdmissionTicket(lane, self._lane_deadline(lane, now, caller_deadline), caller_deadline)
+
+        with self._cond:
+            self.stats[lane]['received'] += 1
+            if not self._can_meet_deadline(ticket, ahead=self._work_ahead(ticket)):
+                self._miss(ticket, 'deadline cannot be met at admission')
+            else:
+                self._enqueue(ticket)
+            self._dispatch()
+
+            while ticket.state == 'queued':
+                timeout = ticket.deadline - self._service_time - time.monotonic()
+                if timeout <= 0:
+                    ticket.entry[-1] = False
+                    self._miss(ticket, 'deadline expired while queued')
+                    self._dispatch()
+                    continue
+                self._cond.wait(timeout)
+
+            if ticket.state == 'shed':
+                raise RequestShed(ticket.lane, 'Deadline cannot be met, request shed')
+        return ticket
+
+    def release(self, ticket, succeeded=True, record_service_time=True):
+        """Finish a running request and hand its slot to the next one
+
+        Only successful requests count towards SLO attainment and, when
+        record_service_time is set, the service time estimate.
+        """
+        now = time.monotonic()
+        with self._cond:
+            self._running -= 1
+            stats = self.stats[ticket.lane]
+            if succeeded:
+                if record_service_time:
+                    self._service_time = 0.8 * self._service_time + 0.2 * (now - ticket.started_at)
+                stats['completed'] += 1
+                # A downgraded request already recorded its miss in its original lane
+                if not ticket.downgraded:
+                    stats['slo_met' if now <= ticket.deadline else 'slo_missed'] += 1
+            else:
+                stats['failed'] += 1
+            self._dispatch()
+
+    def retry_after(self):
+        """Seconds until the current backlog is expected to drain"""
+        with self._cond:
+            pending = sum(1 for entry in self._queue if entry[-1]) + self._running
+            return max(1, int(pending * self._service_time / self.concurrency + 0.5))
+
+    def _lane_deadline(self, lane, enqueued_at, caller_deadline):
+        deadline = enqueued_at + self.lanes[lane]['deadline_ms'] / 1000.0
+        if caller_deadline is not None:
+            deadline = min(deadline, caller_deadline)
+        return deadline
+
+    def _work_ahead(self, ticket):
+        """Requests that would be served before this one"""
+        priority = self.lanes[ticket.lane]['priority']
+        return self._running + sum(
+            1 for entry in self._queue
+            if entry[-1] and entry[0] <= priority
+        )
+
+    def _can_meet_deadline(self, ticket, ahead):
+        now = time.monotonic()
+        waits = ahead // self.concurrency
+        if waits == 0:
+            # A slot is free: run unless the deadline has already passed.
+            # Trusting the estimate here could lock a lane out for good, since
+            # the estimate only comes down when requests complete.
+            return now < ticket.deadline
+        return now + (waits + 1) * self._service_time <= ticket.deadline
+
+    def _enqueue(self, ticket):
+        entry = [self.lanes[ticket.lane]['priority'], ticket.deadline, next(self._seq), ticket, True]
+        ticket.entry = entry
+        ticket.state = 'queued'
+        heapq.heappush(self._queue, entry)
+
+    def _miss(self, ticket, reason):
+        """Shed or downgrade a request that cannot meet its deadline"""
+        lane_config = self.lanes[ticket.lane]
+        if not ticket.downgraded:
+            self.stats[ticket.lane]['slo_missed'] += 1
+        if ticket.state == 'queued':
+            self._record_queue_time(ticket)
+
+        if lane_config['on_miss'] == 'downgrade':
+            target = lane_config['downgrade_to']
+            self.stats[ticket.lane]['downgraded_out'] += 1
+            self.stats[target]['downgraded_in'] += 1
+            logger.info(f"Admission: downgrading {ticket.lane} -> {target} ({reason})")
+            ticket.lane = target
+            ticket.downgraded = True
+            ticket.lane_enqueued_at = time.monotonic()
+            ticket.deadline = self._lane_deadline(target, ticket.enqueued_at, ticket.caller_deadline)
+            if self._can_meet_deadline(ticket, ahead=self._work_ahead(ticket)):
+                self._enqueue(ticket)
+                return
+            reason = f'{reason} after downgrade'
+
+        self.stats[ticket.lane]['shed'] += 1
+        ticket.state = 'shed'
+        logger.warning(f"Admission: shedding {ticket.lane} request ({reason})")
+
+    def _dispatch(self):
+        """Start queued requests while slots are free (caller holds the lock)"""
+        while self._running < self.concurrency and self._queue:
+            entry = heapq.heappop(self._queue)
+            if not entry[-1]:
+                continue
+            ticket = entry[-2]
+            if not self._can_meet_deadline(ticket, ahead=0):
+                self._miss(ticket, 'deadline expired while queued')
+                continue
+            ticket.state = 'running'
+            ticket.started_at = time.monotonic()
+            self._record_queue_time(ticket)
+            self._running += 1
+        self._cond.notify_all()
+
+    def _record_queue_time(self, ticket):
+        """Record time spent queued in the ticket's current lane"""
+        waited_ms = (time.monotonic() - ticket.lane_enqueued_at) * 1000
+        stats = self.stats[ticket.lane]
+        stats['queue_samples'] += 1
+        stats['queue_time_ms_total'] += waited_ms
+        stats['queue_time_ms_max'] = max(stats['queue_time_ms_max'], waited_ms)
+
+    def snapshot(self):
+        """Per-lane queue time, shed counts and SLO attainment
+
+        `received` counts requests arriving in a lane; downgraded requests
+        enter their new lane through `downgraded_in` and leave the old one
+        through `downgraded_out`, so for each lane
+        received + downgraded_in = completed + failed + shed + downgraded_out
+        + queued + running. Queue time is recorded in the lane a request
+        actually waited in.
+
+        SLO attainment is counted in the lane a request arrived in: a
+        downgrade or shed is a miss there, and failed requests are excluded.
+        """
+        with self._cond:
+            lanes = {}
+            for name, stats in self.stats.items():
+                judged = stats['slo_met'] + stats['slo_missed']
+                lanes[name] = {
+                    **self.lanes[name],
+                    **stats,
+                    'queued': sum(1 for entry in self._queue if entry[-1] and entry[-2].lane == name),
+                    'queue_time_ms_total': round(stats['queue_time_ms_total'], 2),
+                    'queue_time_ms_max': round(stats['queue_time_ms_max'], 2),
+                    'queue_time_ms_avg': round(
+                        stats['queue_time_ms_total'] / stats['queue_samples'], 2
+                    ) if stats['queue_samples'] else None,
+                    'slo_attainment': round(stats['slo_met'] / judged, 4) if judged else None
+                }
+            return {
+                'concurrency': self.concurrency,
+                'running': self._running,
+                'service_time_ms': round(self._service_time * 1000, 2),
+                'lanes': lanes
+            }
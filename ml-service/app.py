@@ -1,5 +1,5 @@
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 import tensorflow as tf
@@ -14,6 +14,17 @@ import io
 import base64
 from datetime import datetime
 import logging
+import hmac
+import threading
+import random
+import time
+import zipfile
+from functools import wraps
+from admission import AdmissionController, PRIORITY_LANES, RequestShed
+from profiling import (
+    COLLECTORS, PYINSTRUMENT_AVAILABLE, RequestProfile, find_profile,
+    list_profiles, profile_model_stage, profile_stage, resolve_collector
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -48,6 +59,93 @@ REPAIR_COST_MAPPING = {
     'severe': {'min': 8000, 'max': 25000, 'avg': 16500}
 }
 
+# Admin token for operational endpoints (admin endpoints are disabled if unset)
+ADMIN_TOKEN = os.environ.get('ML_ADMIN_TOKEN')
+
+# Profiling output (bounded rotating directory)
+PROFILE_DIR = os.environ.get('ML_PROFILE_DIR', 'profiles')
+PROFILE_MAX_CAPTURES = int(os.environ.get('ML_PROFILE_MAX_CAPTURES', 20))
+
+# Profiling state, toggled at runtime via /admin/profiling
+profiling = {
+    'enabled': False,
+    'sample_rate': 0.0,
+    'until': None,
+    'collector': 'auto',
+    'tf_trace': False,
+    'track_allocations': True,
+    'captured': 0
+}
+profiling_lock = threading.Lock()
+# Only one request is profiled at a time: tracemalloc and the TF profiler are process-wide
+profile_capture_lock = threading.Lock()
+
+# Admission control for /predict (see admission.PRIORITY_LANES)
+DEFAULT_LANE = os.environ.get('ML_DEFAULT_LANE', 'first_report')
+# Optional JSON mapping of API key -> lane, e.g. {"key123": "background"}
+LANE_API_KEYS = json.loads(os.environ.get('ML_LANE_API_KEYS', '{}'))
+INFERENCE_CONCURRENCY = int(os.environ.get('ML_INFERENCE_CONCURRENCY', 2))
+
+admission = AdmissionController(PRIORITY_LANES, INFERENCE_CONCURRENCY, DEFAULT_LANE, LANE_API_KEYS)
+
+def require_admin(f):
+    """Restrict an endpoint to callers presenting the admin token"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Admin endpoints are disabled'}), 403
+        token = request.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return f(*args, **kwargs)
+    return decorated
+
+def end_expired_profiling_window():
+    """Disable profiling once its time window has passed (caller holds profiling_lock)"""
+    if profiling['until'] is not None and time.time() > profiling['until']:
+        profiling['enabled'] = False
+        profiling['until'] = None
+        logger.info("Profiling window ended")
+
+def start_request_profile():
+    """Return a started RequestProfile if this request is sampled, else None"""
+    if not profiling['enabled']:
+        return None
+
+    with profiling_lock:
+        end_expired_profiling_window()
+        if not profiling['enabled']:
+            return None
+        if random.random() >= profiling['sample_rate']:
+            return None
+        collector = resolve_collector(profiling['collector'])
+        track_allocations = profiling['track_allocations']
+        tf_trace = profiling['tf_trace']
+
+    if not profile_capture_lock.acquire(blocking=False):
+        return None
+
+    try:
+        profile = RequestProfile(PROFILE_DIR, collector, track_allocations, tf_trace)
+        profile.start()
+    except Exception as e:
+        profile_capture_lock.release()
+        logger.error(f"Error starting profile: {e}")
+        return None
+
+    with profiling_lock:
+        profiling['captured'] += 1
+    return profile
+
+def finish_request_profile(profile):
+    """Write a request profile and release the capture slot"""
+    try:
+        profile.finish(PROFILE_MAX_CAPTURES)
+    except Exception as e:
+        logger.error(f"Error writing profile: {e}")
+    finally:
+        profile_capture_lock.release()
+
 def load_ml_model():
     """Load the trained model and class names"""
     global model, class_names, model_metrics
@@ -131,7 +229,10 @@ def home():
         'endpoints': {
             'predict': '/predict (POST)',
             'health': '/health (GET)',
-            'model_info': '/model-info (GET)'
+            'model_info': '/model-info (GET)',
+            'admission': '/admin/admission (GET, admin)',
+            'profiling': '/admin/profiling (GET, POST, admin)',
+            'profile_download': '/admin/profiling/<name> (GET, admin)'
         }
     })
 
@@ -157,9 +258,105 @@ def model_info():
         'repair_cost_ranges': REPAIR_COST_MAPPING
     })
 
+@app.route('/admin/admission')
+@require_admin
+def admission_stats():
+    """Get per-lane admission control statistics"""
+    return jsonify(admission.snapshot())
+
+@app.route('/admin/profiling', methods=['GET'])
+@require_admin
+def profiling_status():
+    """Get profiling state and available captures"""
+    with profiling_lock:
+        end_expired_profiling_window()
+        state = dict(profiling)
+    return jsonify({
+        'profiling': state,
+        'pyinstrument_available': PYINSTRUMENT_AVAILABLE,
+        'max_captures': PROFILE_MAX_CAPTURES,
+        'captures': list_profiles(PROFILE_DIR)
+    })
+
+@app.route('/admin/profiling', methods=['POST'])
+@require_admin
+def configure_profiling():
+    """Enable or disable sampled profiling of /predict
+
+    JSON body: enabled (bool), sample_rate (0-1), duration_seconds (optional
+    time window), collector (auto, pyinstrument or cprofile), tf_trace (bool),
+    track_allocations (bool)
+    """
+    data = request.get_json(silent=True) or {}
+
+    flags = {
+        'enabled': data.get('enabled', True),
+        'tf_trace': data.get('tf_trace', False),
+        'track_allocations': data.get('track_allocations', True)
+    }
+    for key, value in flags.items():
+        if not isinstance(value, bool):
+            return jsonify({'error': f'{key} must be a boolean'}), 400
+
+    collector = data.get('collector', 'auto')
+    if collector not in COLLECTORS:
+        return jsonify({'error': f'collector must be one of {list(COLLECTORS)}'}), 400
+    if collector == 'pyinstrument' and not PYINSTRUMENT_AVAILABLE:
+        return jsonify({'error': 'pyinstrument is not installed'}), 400
+
+    try:
+        sample_rate = float(data.get('sample_rate', 1.0))
+        duration = data.get('duration_seconds')
+        duration = float(duration) if duration is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid sample_rate or duration_seconds'}), 400
+
+    if not 0.0 <= sample_rate <= 1.0:
+        return jsonify({'error': 'sample_rate must be between 0 and 1'}), 400
+    if duration is not None and duration <= 0:
+        return jsonify({'error': 'duration_seconds must be positive'}), 400
+
+    with profiling_lock:
+        profiling['enabled'] = flags['enabled']
+        profiling['sample_rate'] = sample_rate
+        profiling['until'] = time.time() + duration if duration else None
+        profiling['collector'] = collector
+        profiling['tf_trace'] = flags['tf_trace']
+        profiling['track_allocations'] = flags['track_allocations']
+        state = dict(profiling)
+
+    logger.info(f"Profiling updated: {state}")
+    return jsonify({'success': True, 'profiling': state})
+
+@app.route('/admin/profiling/<name>', methods=['GET'])
+@require_admin
+def download_profile(name):
+    """Download a capture as a zip archive"""
+    capture_path = find_profile(PROFILE_DIR, name)
+    if capture_path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for root, _, files in os.walk(capture_path):
+            for filename in files:
+                full_path = os.path.join(root, filename)
+                zf.write(full_path, os.path.relpath(full_path, capture_path))
+    archive.seek(0)
+
+    return send_file(
+        archive,
+        mimetype='application/zip',
+        as_attachment=True,
+        download_name=f'{name}.zip'
+    )
+
 @app.route('/predict', methods=['POST'])
 def predict():
     """Predict damage severity from uploaded image"""
+    profile = None
+    ticket = None
+    succeeded = False
     try:
         if 'image' not in request.files:
             return jsonify({'error': 'No image provided'}), 400
@@ -169,14 +366,31 @@ def predict():
         if file.filename == '':
             return jsonify({'error': 'No image selected'}), 400
 
-        img_bytes = file.read()
-        img = Image.open(io.BytesIO(img_bytes))
-
-        img_array = preprocess_image(img)
+        deadline_ms = request.headers.get('X-Request-Deadline-Ms')
+        try:
+            deadline_ms = int(deadline_ms) if deadline_ms is not None else None
+        except ValueError:
+            return jsonify({'error': 'Invalid X-Request-Deadline-Ms header'}), 400
+        if deadline_ms is not None and deadline_ms <= 0:
+            return jsonify({'error': 'X-Request-Deadline-Ms must be positive'}), 400
+
+        lane = admission.classify(request.headers)
+        ticket = admission.acquire(lane, deadline_ms)
+        # Profile only admitted requests so queue waits and shed requests don't hold a capture
+        profile = start_request_profile()
+
+        with profile_stage(profile, 'decode', track_allocations=True):
+            img_bytes = file.read()
+            img = Image.open(io.BytesIO(img_bytes))
+            img.load()
+
+        with profile_stage(profile, 'preprocess', track_allocations=True):
+            img_array = preprocess_image(img)
         if img_array is None:
             return jsonify({'error': 'Error preprocessing image'}), 400
 
-        predictions = model.predict(img_array, verbose=0)
+        with profile_model_stage(profile):
+            predictions = model.predict(img_array, verbose=0)
         predicted_class_idx = np.argmax(predictions[0])
         predicted_class = class_names[predicted_class_idx]
         confidence = float(predictions[0][predicted_class_idx] * 100)
@@ -203,14 +417,30 @@ def predict():
 
         logger.info(f"Prediction: {predicted_class} ({confidence:.2f}%)")
 
+        succeeded = True
         return jsonify(result)
 
+    except RequestShed as e:
+        response = jsonify({
+            'success': False,
+            'error': e.reason,
+            'lane': e.lane
+        })
+        response.headers['Retry-After'] = str(admission.retry_after())
+        return response, 503
+
     except Exception as e:
         logger.error(f"Prediction error: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
+    finally:
+        if ticket is not None:
+            # Profiling overhead would skew the service time estimate used for shedding
+            admission.release(ticket, succeeded, record_service_time=profile is None)
+        if profile is not None:
+            finish_request_profile(profile)
 
 @socketio.on('connect')
 def handle_connect():
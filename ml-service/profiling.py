@@ -0,0 +1,187 @@
+"""On-demand profiling of sampled /predict requests"""
+
+import cProfile
+import json
+import logging
+import os
+import pstats
+import shutil
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Optional: pyinstrument stack profiles (cProfile is used when unavailable)
+try:
+    from pyinstrument import Profiler as StackProfiler
+except ImportError:
+    StackProfiler = None
+
+PYINSTRUMENT_AVAILABLE = StackProfiler is not None
+
+# Both collectors install the thread's profile hook, so only one runs per capture
+COLLECTORS = ('auto', 'pyinstrument', 'cprofile')
+
+def resolve_collector(collector):
+    """Map a requested collector to the one that will actually run"""
+    if collector == 'auto':
+        return 'pyinstrument' if PYINSTRUMENT_AVAILABLE else 'cprofile'
+    return collector
+
+class RequestProfile:
+    """Profile capture for a single sampled /predict request"""
+
+    def __init__(self, profile_dir, collector='cprofile', track_allocations=True, tf_trace=False):
+        self.name = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        self.path = os.path.join(profile_dir, self.name)
+        self.profile_dir = profile_dir
+        self.collector = collector
+        self.track_allocations = track_allocations
+        self.tf_trace = tf_trace
+        self.stage_times = {}
+        self.allocations = {}
+        if collector == 'pyinstrument':
+            self.profiler = StackProfiler()
+        else:
+            self.profiler = cProfile.Profile()
+
+    def start(self):
+        os.makedirs(self.path, exist_ok=True)
+        if self.collector == 'pyinstrument':
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    @contextmanager
+    def stage(self, name, track_allocations=False):
+        """Time a stage, optionally recording its allocations with tracemalloc
+
+        tracemalloc traces the whole process, so allocation numbers include
+        other threads running during the stage. Tracing already started by
+        the operator (e.g. PYTHONTRACEMALLOC) is left running.
+        """
+        tracing = None
+        if track_allocations and self.track_allocations:
+            tracing = self._start_allocation_tracking(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_times[name] = round((time.perf_counter() - start) * 1000, 3)
+            if tracing is not None:
+                self._stop_allocation_tracking(name, *tracing)
+
+    def _start_allocation_tracking(self, name):
+        """Return (owns_tracing, snapshot), or None if tracking could not start"""
+        owns_tracing = not tracemalloc.is_tracing()
+        try:
+            if owns_tracing:
+                tracemalloc.start()
+            return owns_tracing, tracemalloc.take_snapshot()
+        except Exception as e:
+            logger.error(f"Error starting allocation tracking for {name}: {e}")
+            if owns_tracing:
+                tracemalloc.stop()
+            return None
+
+    def _stop_allocation_tracking(self, name, owns_tracing, snapshot_before):
+        try:
+            # The peak is only attributable to this stage if tracing began here
+            peak = tracemalloc.get_traced_memory()[1] if owns_tracing else None
+            stats = tracemalloc.take_snapshot().compare_to(snapshot_before, 'lineno')
+            self.allocations[name] = {
+                'peak_bytes': peak,
+                'top': [str(stat) for stat in stats[:15]]
+            }
+        except Exception as e:
+            logger.error(f"Error recording allocations for {name}: {e}")
+        finally:
+            if owns_tracing:
+                tracemalloc.stop()
+
+    @contextmanager
+    def model_stage(self):
+        """Time model inference, capturing a TensorFlow profiler trace if requested"""
+        with self.stage('inference'):
+            tracing = self.tf_trace and self._start_tf_trace()
+            try:
+                yield
+            finally:
+                if tracing:
+                    self._stop_tf_trace()
+
+    def _start_tf_trace(self):
+        """Start a TensorFlow profiler trace, returning False if it could not start"""
+        try:
+            import tensorflow as tf
+            tf.profiler.experimental.start(os.path.join(self.path, 'tf'))
+            return True
+        except Exception as e:
+            logger.error(f"Error starting TensorFlow trace: {e}")
+            return False
+
+    def _stop_tf_trace(self):
+        try:
+            import tensorflow as tf
+            tf.profiler.experimental.stop()
+        except Exception as e:
+            logger.error(f"Error stopping TensorFlow trace: {e}")
+
+    def finish(self, max_captures):
+        """Stop the collector and write the capture to disk"""
+        if self.collector == 'pyinstrument':
+            self.profiler.stop()
+            with open(os.path.join(self.path, 'stacks.html'), 'w') as f:
+                f.write(self.profiler.output_html())
+        else:
+            self.profiler.disable()
+            self.profiler.dump_stats(os.path.join(self.path, 'cprofile.prof'))
+            with open(os.path.join(self.path, 'cprofile.txt'), 'w') as f:
+                pstats.Stats(self.profiler, stream=f).sort_stats('cumulative').print_stats(50)
+
+        with open(os.path.join(self.path, 'summary.json'), 'w') as f:
+            json.dump({
+                'collector': self.collector,
+                'stage_ms': self.stage_times,
+                'allocations': self.allocations,
+                'allocation_scope': 'process-wide (includes all threads)',
+                'tf_trace': self.tf_trace
+            }, f, indent=2)
+
+        rotate_profiles(self.profile_dir, max_captures)
+        logger.info(f"Profile captured: {self.name}")
+
+def rotate_profiles(profile_dir, max_captures):
+    """Keep only the newest max_captures captures"""
+    for name in list_profiles(profile_dir)[max_captures:]:
+        shutil.rmtree(os.path.join(profile_dir, name), ignore_errors=True)
+
+def list_profiles(profile_dir):
+    """List captures, newest first"""
+    if not os.path.isdir(profile_dir):
+        return []
+    return sorted(
+        (name for name in os.listdir(profile_dir)
+         if os.path.isdir(os.path.join(profile_dir, name))),
+        reverse=True
+    )
+
+def find_profile(profile_dir, name):
+    """Return the path of a capture by name, or None if it does not exist"""
+    if name not in list_profiles(profile_dir):
+        return None
+    return os.path.join(profile_dir, name)
+
+def profile_stage(profile, name, track_allocations=False):
+    """Stage context for an optional profile"""
+    if profile is None:
+        return nullcontext()
+    return profile.stage(name, track_allocations)
+
+def profile_model_stage(profile):
+    """Inference stage context for an optional profile"""
+    if profile is None:
+        return nullcontext()
+    return profile.model_stage()
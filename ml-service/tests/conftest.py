@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Make ml-service modules importable without installing the service
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,211 @@
+import threading
+import time
+
+import pytest
+
+from admission import PRIORITY_LANES, AdmissionController, RequestShed
+
+
+def make_controller(lanes=PRIORITY_LANES, concurrency=1, service_time=0.05):
+    return AdmissionController(lanes, concurrency, 'first_report', service_time=service_time)
+
+
+def queued(controller):
+    return sum(lane['queued'] for lane in controller.snapshot()['lanes'].values())
+
+
+def wait_until(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, 'timed out waiting for condition'
+        time.sleep(0.005)
+
+
+def acquire_in_thread(controller, lane, results, deadline_ms=None):
+    def run():
+        try:
+            results.append((lane, controller.acquire(lane, deadline_ms)))
+        except RequestShed as e:
+            results.append((lane, e))
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_higher_lanes_are_scheduled_first():
+    controller = make_controller()
+    holder = controller.acquire('first_report')
+    results = []
+    threads = []
+    for lane in ('background', 'verification', 'first_report'):
+        threads.append(acquire_in_thread(controller, lane, results))
+        wait_until(lambda: queued(controller) == len(threads))
+
+    controller.release(holder)
+    for i in range(len(threads)):
+        wait_until(lambda: len(results) == i + 1)
+        controller.release(results[i][1])
+    for thread in threads:
+        thread.join()
+
+    assert [lane for lane, _ in results] == ['first_report', 'verification', 'background']
+
+
+def test_sheds_at_admission_when_deadline_cannot_be_met():
+    controller = make_controller(service_time=1.0)
+    holder = controller.acquire('first_report')
+
+    with pytest.raises(RequestShed) as exc:
+        controller.acquire('first_report', deadline_ms=100)
+
+    assert exc.value.lane == 'first_report'
+    stats = controller.snapshot()['lanes']['first_report']
+    assert stats['shed'] == 1
+    assert stats['slo_attainment'] == 0.0
+    controller.release(holder)
+
+
+def test_sheds_while_queued_once_deadline_expires():
+    controller = make_controller()
+    controller.acquire('first_report')
+    results = []
+
+    thread = acquire_in_thread(controller, 'first_report', results, deadline_ms=200)
+    thread.join(timeout=2.0)
+
+    assert isinstance(results[0][1], RequestShed)
+    assert queued(controller) == 0
+    assert controller.snapshot()['lanes']['first_report']['shed'] == 1
+
+
+def test_downgrade_keeps_caller_deadline():
+    controller = make_controller()
+    controller.acquire('first_report')
+    results = []
+
+    thread = acquire_in_thread(controller, 'verification', results, deadline_ms=250)
+    thread.join(timeout=2.0)
+
+    assert isinstance(results[0][1], RequestShed)
+    assert results[0][1].lane == 'background'
+    lanes = controller.snapshot()['lanes']
+    assert lanes['verification']['downgraded_out'] == 1
+    assert lanes['verification']['slo_attainment'] == 0.0
+    assert lanes['background']['downgraded_in'] == 1
+    assert lanes['background']['slo_attainment'] is None
+
+
+def test_downgraded_request_runs_in_target_lane_without_counting_slo():
+    lanes = {
+        'first_report': PRIORITY_LANES['first_report'],
+        'verification': {**PRIORITY_LANES['verification'], 'deadline_ms': 150},
+        'background': PRIORITY_LANES['background']
+    }
+    controller = make_controller(lanes)
+    holder = controller.acquire('first_report')
+    results = []
+
+    thread = acquire_in_thread(controller, 'verification', results)
+    wait_until(lambda: controller.snapshot()['lanes']['verification']['downgraded_out'] == 1)
+    controller.release(holder)
+    thread.join(timeout=2.0)
+    ticket = results[0][1]
+    controller.release(ticket)
+
+    assert ticket.lane == 'background'
+    stats = controller.snapshot()['lanes']
+    assert stats['verification']['slo_attainment'] == 0.0
+    assert stats['background']['completed'] == 1
+    assert stats['background']['slo_attainment'] is None
+
+
+def test_failed_requests_do_not_count_towards_slo_or_service_time():
+    controller = make_controller(service_time=0.5)
+    ticket = controller.acquire('first_report')
+
+    controller.release(ticket, succeeded=False)
+
+    stats = controller.snapshot()
+    assert stats['service_time_ms'] == 500.0
+    assert stats['lanes']['first_report']['completed'] == 0
+    assert stats['lanes']['first_report']['failed'] == 1
+    assert stats['lanes']['first_report']['slo_attainment'] is None
+
+
+def test_retry_after_ignores_expired_requests():
+    controller = make_controller(concurrency=4, service_time=1.0)
+    holders = [controller.acquire('first_report') for _ in range(4)]
+    before = controller.retry_after()
+    results = []
+
+    threads = [
+        acquire_in_thread(controller, 'first_report', results, deadline_ms=2500)
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.join(timeout=5.0)
+
+    assert all(isinstance(result, RequestShed) for _, result in results)
+    assert controller.retry_after() == before
+    for holder in holders:
+        controller.release(holder)
+
+
+def test_idle_controller_admits_after_slow_request():
+    lanes = {**PRIORITY_LANES, 'first_report': {**PRIORITY_LANES['first_report'], 'deadline_ms': 100}}
+    controller = make_controller(lanes)
+    slow = controller.acquire('first_report')
+    time.sleep(0.6)
+    controller.release(slow)
+    assert controller.snapshot()['service_time_ms'] > 100
+
+    ticket = controller.acquire('first_report')
+
+    assert controller.snapshot()['running'] == 1
+    controller.release(ticket)
+
+
+def test_received_counts_arrivals_in_their_own_lane():
+    controller = make_controller(service_time=1.0)
+    holder = controller.acquire('first_report')
+    results = []
+
+    thread = acquire_in_thread(controller, 'verification', results, deadline_ms=200)
+    thread.join(timeout=2.0)
+    controller.release(holder)
+
+    lanes = controller.snapshot()['lanes']
+    assert lanes['first_report']['received'] == 1
+    assert lanes['verification']['received'] == 1
+    assert lanes['background']['received'] == 0
+    assert lanes['background']['downgraded_in'] == 1
+    assert lanes['background']['shed'] == 1
+
+
+def test_queue_time_is_only_recorded_where_the_request_waited():
+    controller = make_controller()
+    controller.acquire('first_report')
+    results = []
+
+    thread = acquire_in_thread(controller, 'verification', results, deadline_ms=250)
+    thread.join(timeout=2.0)
+
+    lanes = controller.snapshot()['lanes']
+    assert lanes['verification']['queue_samples'] == 1
+    assert lanes['verification']['queue_time_ms_max'] >= 100
+    assert lanes['background']['queue_samples'] == 0
+
+
+def test_rejects_unknown_lanes_in_configuration():
+    with pytest.raises(ValueError):
+        AdmissionController(PRIORITY_LANES, 1, 'first-report')
+    with pytest.raises(ValueError):
+        AdmissionController(PRIORITY_LANES, 1, 'first_report', {'key': 'bulk'})
+
+
+def test_classify_prefers_api_key_over_header():
+    controller = AdmissionController(PRIORITY_LANES, 1, 'first_report', {'bulk-key': 'background'})
+
+    assert controller.classify({'X-API-Key': 'bulk-key', 'X-Priority-Lane': 'first_report'}) == 'background'
+    assert controller.classify({'X-Priority-Lane': 'verification'}) == 'verification'
+    assert controller.classify({'X-Priority-Lane': 'unknown'}) == 'first_report'
@@ -0,0 +1,113 @@
+import json
+import os
+import sys
+import tracemalloc
+from types import SimpleNamespace
+
+from profiling import (
+    RequestProfile, find_profile, list_profiles, profile_stage, rotate_profiles
+)
+
+
+def make_captures(profile_dir, names):
+    for name in names:
+        os.makedirs(os.path.join(profile_dir, name))
+
+
+def test_rotate_keeps_newest_captures(tmp_path):
+    names = [f'20260101-00000{i}-000000' for i in range(5)]
+    make_captures(tmp_path, names)
+
+    rotate_profiles(str(tmp_path), 2)
+
+    assert list_profiles(str(tmp_path)) == [names[4], names[3]]
+
+
+def test_list_profiles_ignores_files_and_missing_dir(tmp_path):
+    make_captures(tmp_path, ['20260101-000000-000000'])
+    (tmp_path / 'stray.txt').write_text('x')
+
+    assert list_profiles(str(tmp_path)) == ['20260101-000000-000000']
+    assert list_profiles(str(tmp_path / 'missing')) == []
+
+
+def test_find_profile_only_returns_known_captures(tmp_path):
+    profile_dir = tmp_path / 'profiles'
+    make_captures(profile_dir, ['20260101-000000-000000'])
+    os.makedirs(tmp_path / 'secret')
+
+    assert find_profile(str(profile_dir), '20260101-000000-000000') == \
+        os.path.join(str(profile_dir), '20260101-000000-000000')
+    assert find_profile(str(profile_dir), '../secret') is None
+    assert find_profile(str(profile_dir), '..') is None
+    assert find_profile(str(profile_dir), 'unknown') is None
+
+
+def test_cprofile_capture_is_written_and_rotated(tmp_path):
+    make_captures(tmp_path, ['00000000-000000-000000'])
+
+    profile = RequestProfile(str(tmp_path), collector='cprofile')
+    profile.start()
+    with profile_stage(profile, 'decode', track_allocations=True):
+        data = [bytes(1024) for _ in range(100)]
+    profile.finish(max_captures=1)
+
+    assert list_profiles(str(tmp_path)) == [profile.name]
+    assert os.path.exists(os.path.join(profile.path, 'cprofile.prof'))
+    with open(os.path.join(profile.path, 'summary.json')) as f:
+        summary = json.load(f)
+    assert summary['collector'] == 'cprofile'
+    assert 'decode' in summary['stage_ms']
+    assert summary['allocations']['decode']['peak_bytes'] > 0
+    assert not tracemalloc.is_tracing()
+    del data
+
+
+def test_stage_leaves_existing_tracing_running(tmp_path):
+    profile = RequestProfile(str(tmp_path))
+    tracemalloc.start()
+    try:
+        with profile.stage('preprocess', track_allocations=True):
+            pass
+        assert tracemalloc.is_tracing()
+        assert profile.allocations['preprocess']['peak_bytes'] is None
+    finally:
+        tracemalloc.stop()
+
+
+def test_profile_stage_without_profile_is_noop():
+    with profile_stage(None, 'decode', track_allocations=True):
+        pass
+
+
+def test_allocation_tracking_errors_do_not_fail_the_stage(tmp_path, monkeypatch):
+    def fail():
+        raise RuntimeError('snapshot failed')
+    monkeypatch.setattr(tracemalloc, 'take_snapshot', fail)
+    profile = RequestProfile(str(tmp_path))
+
+    with profile.stage('decode', track_allocations=True):
+        ran = True
+
+    assert ran
+    assert 'decode' in profile.stage_times
+    assert 'decode' not in profile.allocations
+    assert not tracemalloc.is_tracing()
+
+
+def test_tf_trace_errors_do_not_fail_inference(tmp_path, monkeypatch):
+    def fail(logdir):
+        raise RuntimeError('another profiler session is active')
+    stopped = []
+    fake_tf = SimpleNamespace(profiler=SimpleNamespace(experimental=SimpleNamespace(
+        start=fail, stop=lambda: stopped.append(True)
+    )))
+    monkeypatch.setitem(sys.modules, 'tensorflow', fake_tf)
+    profile = RequestProfile(str(tmp_path), tf_trace=True)
+
+    with profile.model_stage():
+        ran = True
+
+    assert ran
+    assert 'inference' in profile.stage_times
+    assert stopped == []